@@ -1,4 +1,5 @@
 from file_processor import FileProcessor
+from extractors import supported_file_types
 import os
 
 class FileChatInterface:
@@ -8,7 +9,7 @@ class FileChatInterface:
     def handle_file_upload(self):
         """Handle file upload interface"""
         print("\n📁 File Upload")
-        print("Supported formats: PDF, TXT, CSV, DOCX")
+        print(f"Supported formats: {', '.join(t.upper() for t in supported_file_types())}")
         print("Enter file path or type 'back' to return to main menu")
         
         while True:
@@ -56,6 +57,11 @@ class FileChatInterface:
             if question:
                 response = self.processor.chat_with_files(question)
                 print(f"\n📝 Answer: {response}")
+                
+                usage = self.processor.get_last_turn_usage()
+                if usage:
+                    print(f"   (tokens: ~{usage['context_tokens']} context, ~{usage['history_tokens']} history, "
+                          f"~{usage['question_tokens']} question)")
     
     def show_file_menu(self):
         """Show file operations menu"""
@@ -1,7 +1,17 @@
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, make_url, text
 from dotenv import load_dotenv
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+import itertools
+import json
 import os
+import random
+import re
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -28,9 +38,162 @@ except Exception as e:
     print(f"❌ Error creating engine: {e}")
     sys.exit(1)
 
+def _parse_named_urls(value: str, prefix: str) -> dict:
+    """Parse 'name=url,url2,...' into {name: url}; unnamed entries are numbered."""
+    urls = {}
+    for i, entry in enumerate(filter(None, (e.strip() for e in (value or "").split(","))), 1):
+        name, sep, url = entry.partition("=")
+        # A bare URL has no 'name=' part (URLs may contain '=' only after '?')
+        if not sep or "://" in name:
+            name, url = f"{prefix}_{i}", entry
+        urls[name.strip()] = url.strip()
+    return urls
+
+# Optional read replicas and shards, e.g. DB_REPLICA_URLS="r1=postgresql+psycopg2://...,r2=..."
+DB_REPLICA_URLS = _parse_named_urls(os.getenv("DB_REPLICA_URLS"), "replica")
+DB_SHARD_URLS = _parse_named_urls(os.getenv("DB_SHARD_URLS"), "shard")
+
+# How reads are spread over replicas: round_robin, random or least_lag
+DB_REPLICA_POLICY = os.getenv("DB_REPLICA_POLICY", "round_robin")
+
+# Replicas further behind the primary than this (seconds) are skipped
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", "30"))
+
+# How often replica lag is measured in the background (seconds)
+REPLICA_LAG_CHECK_INTERVAL = 5.0
+
+# Lag readings older than this are not trusted, e.g. if the monitor is stuck (seconds)
+REPLICA_LAG_STALE_AFTER = 3 * REPLICA_LAG_CHECK_INTERVAL
+
+# Unreachable replicas are re-probed after an interval that doubles up to this (seconds)
+REPLICA_MAX_BACKOFF = 120.0
+
+# Connection timeout for replica and shard engines, so a dead host fails fast (seconds)
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+
+# Data-modifying CTEs, SELECT INTO, sequence changes and row locks must run on the primary
+_WRITE_QUERY_RE = re.compile(
+    r"\b(insert|update|delete|merge|into|nextval|setval|pg_advisory_\w*lock\w*)\b"
+    r"|\bfor\s+(no\s+key\s+)?(update|share|key\s+share)\b",
+    re.IGNORECASE
+)
+
+# Seconds since the replica last replayed WAL, or 0 when it has caught up
+_REPLICA_LAG_QUERY = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+def _create_secondary_engine(url: str):
+    """Create an engine for a replica or shard that fails fast when the host is down."""
+    connect_args = {}
+    if make_url(url).get_backend_name() == "postgresql":
+        connect_args["connect_timeout"] = DB_CONNECT_TIMEOUT
+    return create_engine(url, pool_pre_ping=True, connect_args=connect_args)
+
+def is_read_only_query(query: str) -> bool:
+    """Check whether a query only reads data and can be served by a replica."""
+    return bool(_STREAMABLE_QUERY_RE.match(query)) and not _WRITE_QUERY_RE.search(query)
+
+class EngineRouter:
+    """Route queries to named engines: reads to replicas, writes to the primary.
+
+    Replica lag is measured by a background thread, so routing a query only
+    reads cached values and never waits on a slow or unreachable replica.
+    """
+
+    def __init__(self, primary, replica_urls: dict = None, shard_urls: dict = None,
+                 policy: str = DB_REPLICA_POLICY, max_lag: float = DB_REPLICA_MAX_LAG):
+        if policy not in ("round_robin", "random", "least_lag"):
+            raise ValueError(f"Unknown replica policy: {policy}")
+        self.engines = {"primary": primary}
+        self.replicas = []
+        self.shards = []
+        for name, url in (replica_urls or {}).items():
+            self.engines[name] = _create_secondary_engine(url)
+            self.replicas.append(name)
+        for name, url in (shard_urls or {}).items():
+            self.engines[name] = _create_secondary_engine(url)
+            self.shards.append(name)
+        self.policy = policy
+        self.max_lag = max_lag
+        self._counter = itertools.count()
+        # name -> (lag seconds, measured at, next probe at, consecutive failures)
+        self._lag = {}
+        self._lock = threading.Lock()
+        if self.replicas:
+            threading.Thread(target=self._monitor_lag, daemon=True).start()
+
+    def refresh_replica_lag(self, name: str) -> float:
+        """Measure a replica's lag now; unreachable replicas report infinity and are backed off."""
+        try:
+            with self.engines[name].connect() as conn:
+                lag = float(conn.execute(text(_REPLICA_LAG_QUERY)).scalar() or 0)
+            failures = 0
+            retry_in = REPLICA_LAG_CHECK_INTERVAL
+        except Exception:
+            lag = float("inf")
+            with self._lock:
+                failures = self._lag.get(name, (None, 0.0, 0.0, 0))[3] + 1
+            retry_in = min(REPLICA_LAG_CHECK_INTERVAL * 2 ** failures, REPLICA_MAX_BACKOFF)
+        now = time.monotonic()
+        with self._lock:
+            self._lag[name] = (lag, now, now + retry_in, failures)
+        return lag
+
+    def _monitor_lag(self):
+        """Background loop keeping every replica's lag reading fresh."""
+        while True:
+            for name in self.replicas:
+                with self._lock:
+                    next_probe = self._lag.get(name, (None, 0.0, 0.0, 0))[2]
+                if time.monotonic() >= next_probe:
+                    self.refresh_replica_lag(name)
+            time.sleep(REPLICA_LAG_CHECK_INTERVAL / 5)
+
+    def replica_lag(self, name: str) -> float:
+        """Last measured lag of a replica; infinity if unknown, stale or unreachable."""
+        with self._lock:
+            lag, measured_at, _, _ = self._lag.get(name, (None, 0.0, 0.0, 0))
+        if lag is None or time.monotonic() - measured_at > REPLICA_LAG_STALE_AFTER:
+            return float("inf")
+        return lag
+
+    def pick_replica(self):
+        """Choose a replica within the lag limit according to the policy, or None."""
+        healthy = [name for name in self.replicas if self.replica_lag(name) <= self.max_lag]
+        if not healthy:
+            return None
+        if self.policy == "least_lag":
+            return min(healthy, key=self.replica_lag)
+        if self.policy == "random":
+            return random.choice(healthy)
+        return healthy[next(self._counter) % len(healthy)]
+
+    def route(self, query: str) -> str:
+        """Name of the engine that should run a query."""
+        if self.replicas and is_read_only_query(query):
+            replica = self.pick_replica()
+            if replica:
+                return replica
+        return "primary"
+
+    def connect(self, query: str, engine_name: str = None):
+        """Open a connection on the engine chosen for the query (or on engine_name)."""
+        name = engine_name or self.route(query)
+        conn = self.engines[name].connect()
+        if name != "primary":
+            # Replicas and fan-out queries never write, even if the check above missed something
+            conn.execution_options(postgresql_readonly=True)
+        return conn
+
+router = EngineRouter(engine, DB_REPLICA_URLS, DB_SHARD_URLS)
+
 def execute_sql(query: str):
     """Execute SQL query and return results or error message."""
-    with engine.connect() as conn:
+    with router.connect(query) as conn:
         try:
             result = conn.execute(text(query))
             if result.returns_rows:
@@ -41,3 +204,575 @@ def execute_sql(query: str):
                 return None, "✅ Query executed successfully (no returned rows)."
         except Exception as e:
             return None, f"❌ Error executing query: {str(e)}"
+
+
+# Rows pulled from the server-side cursor per round trip
+FETCH_BATCH_SIZE = 10000
+
+# Only plain queries can be wrapped in a server-side cursor (DECLARE ... CURSOR FOR)
+_STREAMABLE_QUERY_RE = re.compile(r"^\s*(\(|select\b|with\b|values\b)", re.IGNORECASE)
+
+def _stream_options(query: str, batch_size: int) -> dict:
+    """Execution options that stream the query from a server-side cursor when possible."""
+    if _STREAMABLE_QUERY_RE.match(query):
+        return {"stream_results": True, "max_row_buffer": batch_size}
+    return {}
+
+def _column_to_arrow(values: list) -> pa.Array:
+    """Convert one column of a fetched batch to an Arrow array."""
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+        # Types Arrow cannot infer (UUID, ranges, mixed JSON...) fall back to text
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def _rows_to_record_batch(columns: list, rows: list) -> pa.RecordBatch:
+    """Transpose a batch of rows into an Arrow record batch."""
+    column_values = zip(*rows) if rows else [[] for _ in columns]
+    arrays = [_column_to_arrow(list(values)) for values in column_values]
+    return pa.RecordBatch.from_arrays(arrays, names=columns)
+
+def _unify_batches(columns: list, batches: list) -> pa.Table:
+    """Combine record batches into one table, reconciling per-batch inferred types.
+
+    Types are inferred per batch, so a column that is all NULL in one batch
+    comes back as the null type, and mixed values may infer differently.
+    Columns are matched by position since query results may repeat names.
+    """
+    column_types = []
+    for i in range(len(columns)):
+        types = [batch.column(i).type for batch in batches]
+        non_null = [t for t in types if not pa.types.is_null(t)]
+        target = non_null[0] if non_null else pa.null()
+        if any(t != target for t in non_null):
+            try:
+                target = pa.unify_schemas(
+                    [pa.schema([("c", t)]) for t in non_null], promote_options="permissive"
+                ).field("c").type
+            except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+                target = pa.string()
+        column_types.append(target)
+
+    unified_columns = []
+    for i, target in enumerate(column_types):
+        arrays = [batch.column(i) for batch in batches]
+        try:
+            arrays = [array if array.type == target else array.cast(target) for array in arrays]
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError):
+            # Every batch must share the column type, so one failed cast turns the whole column into text
+            arrays = [pa.array([None if v is None else str(v) for v in array.to_pylist()], type=pa.string())
+                      for array in arrays]
+        unified_columns.append(arrays)
+
+    unified = [
+        pa.RecordBatch.from_arrays([arrays[b] for arrays in unified_columns], names=columns)
+        for b in range(len(batches))
+    ]
+    return pa.Table.from_batches(unified)
+
+def iter_record_batches(result, batch_size: int = FETCH_BATCH_SIZE, job=None):
+    """Yield Arrow record batches from a row-returning result, batch_size rows at a time."""
+    columns = list(result.keys())
+    while True:
+        if job is not None:
+            job.check_cancelled()
+        rows = result.fetchmany(batch_size)
+        if not rows:
+            break
+        yield _rows_to_record_batch(columns, rows)
+
+def _execute_streaming(conn, query: str, batch_size: int = FETCH_BATCH_SIZE, job=None):
+    """Start a query with streaming options, under the job's control when one is given."""
+    options = _stream_options(query, batch_size)
+    if job is None:
+        return conn.execution_options(**options).execute(text(query))
+    job.attach(conn)
+    return job.execute(conn, text(query), **options)
+
+def _fetch_record_batches(conn, query: str, batch_size: int = FETCH_BATCH_SIZE, job=None):
+    """Run a query on a connection and return its columns and record batches.
+
+    Returns (None, None) for statements that do not return rows. When a
+    QueryJob is given the connection is registered with it so the query can
+    be cancelled from another thread.
+    """
+    result = _execute_streaming(conn, query, batch_size, job)
+    if not result.returns_rows:
+        return None, None
+    columns = list(result.keys())
+    batches = list(iter_record_batches(result, batch_size, job))
+    return columns, batches or [_rows_to_record_batch(columns, [])]
+
+def execute_sql_arrow(query: str, batch_size: int = FETCH_BATCH_SIZE, job=None):
+    """Execute SQL query and return results as a pyarrow Table or error message.
+
+    Rows are streamed from a server-side cursor in batches of ``batch_size``
+    and converted to columnar form as they arrive, so only one batch of
+    Python row objects is alive at a time.
+    """
+    with router.connect(query) as conn:
+        try:
+            columns, batches = _fetch_record_batches(conn, query, batch_size, job)
+            if columns is not None:
+                return columns, _unify_batches(columns, batches)
+            else:
+                return None, "✅ Query executed successfully (no returned rows)."
+        except Exception as e:
+            return None, f"❌ Error executing query: {str(e)}"
+
+# Name of the column added to fan-out results to tell shards apart
+SHARD_COLUMN = "_shard"
+
+def _add_shard_column(batch: pa.RecordBatch, name: str, columns: list) -> pa.RecordBatch:
+    """Append the _shard column naming the shard a batch came from."""
+    shard = pa.array([name] * batch.num_rows, type=pa.string())
+    return pa.RecordBatch.from_arrays(batch.columns + [shard], names=columns)
+
+def _check_fanout(query: str, shards: list):
+    """Return the error message for a query that cannot fan out, or None."""
+    if not shards:
+        return "❌ No shards configured. Set DB_SHARD_URLS to enable fan-out queries."
+    if not is_read_only_query(query):
+        return "❌ Only read-only queries can be run across shards."
+    return None
+
+def execute_sql_fanout(query: str, shards: list = None, batch_size: int = FETCH_BATCH_SIZE, job=None):
+    """Run a read-only query on several shards concurrently and return merged results or error message.
+
+    Each shard streams its rows into Arrow batches in its own thread and the
+    results are concatenated with a ``_shard`` column naming their source.
+    Rows are merged, not re-aggregated: ORDER BY, LIMIT and aggregates apply
+    per shard.
+    """
+    shards = shards or router.shards
+    error = _check_fanout(query, shards)
+    if error:
+        return None, error
+
+    def run_on_shard(name):
+        with router.connect(query, engine_name=name) as conn:
+            return _fetch_record_batches(conn, query, batch_size, job)
+
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        futures = {name: pool.submit(run_on_shard, name) for name in shards}
+
+    results = {}
+    errors = []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            errors.append(f"{name}: {str(e)}")
+    if errors:
+        return None, f"❌ Error executing query on shards: {'; '.join(errors)}"
+
+    columns = results[shards[0]][0]
+    mismatched = [name for name, (shard_columns, _) in results.items() if shard_columns != columns]
+    if mismatched:
+        return None, f"❌ Shards returned different columns: {', '.join(mismatched)}"
+
+    merged_columns = columns + [SHARD_COLUMN]
+    batches = []
+    for name, (_, shard_batches) in results.items():
+        for batch in shard_batches:
+            batches.append(_add_shard_column(batch, name, merged_columns))
+    return merged_columns, _unify_batches(merged_columns, batches)
+
+def _format_plan(node: dict, depth: int = 0) -> list:
+    """Render an EXPLAIN (FORMAT JSON) plan node and its children as indented lines."""
+    label = node.get("Node Type", "?")
+    if node.get("Relation Name"):
+        label += f" on {node['Relation Name']}"
+    if node.get("Index Name"):
+        label += f" using {node['Index Name']}"
+    lines = [
+        f"{'  ' * depth}{'-> ' if depth else ''}{label}  "
+        f"(cost={node.get('Startup Cost', 0):.2f}..{node.get('Total Cost', 0):.2f} rows={node.get('Plan Rows', 0)})"
+    ]
+    for key in ("Filter", "Index Cond", "Hash Cond", "Join Filter"):
+        if node.get(key):
+            lines.append(f"{'  ' * (depth + 1)}{key}: {node[key]}")
+    for child in node.get("Plans", []):
+        lines.extend(_format_plan(child, depth + 1))
+    return lines
+
+def explain_sql(query: str):
+    """Ask the planner for a query's estimated cost without running it.
+
+    Returns (total_cost, plan_text). Raises if the query does not parse or plan.
+    """
+    with router.connect(query) as conn:
+        explained = conn.execute(text(f"EXPLAIN (FORMAT JSON) {query.strip().rstrip(';')}")).scalar()
+    if isinstance(explained, str):
+        explained = json.loads(explained)
+    plan = explained[0]["Plan"]
+    return float(plan["Total Cost"]), "\n".join(_format_plan(plan))
+
+def rank_sql_candidates(candidates: list) -> list:
+    """EXPLAIN candidate queries concurrently and rank them by estimated cost.
+
+    Returns one dict per candidate with 'sql', 'cost', 'plan' and 'error' keys,
+    cheapest valid candidate first and candidates that failed to plan last.
+    """
+    def explain_candidate(sql_query):
+        try:
+            cost, plan = explain_sql(sql_query)
+            return {'sql': sql_query, 'cost': cost, 'plan': plan, 'error': None}
+        except Exception as e:
+            return {'sql': sql_query, 'cost': None, 'plan': None, 'error': str(e).split("\n")[0]}
+
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=len(candidates)) as pool:
+        ranked = list(pool.map(explain_candidate, candidates))
+    # Stable sort keeps generation order among equal costs
+    return sorted(ranked, key=lambda c: (c['error'] is not None, c['cost'] or 0.0))
+
+# Formats supported by export_sql
+EXPORT_FORMATS = ("csv", "parquet")
+
+def _is_text_export_type(data_type: pa.DataType) -> bool:
+    """Whether a column type is written out as text in exports.
+
+    Nested values (JSON objects, arrays) and decimals are inferred per batch
+    with shapes and precision that can change from one batch to the next, so
+    any fixed Arrow type could drop fields or round values. Text keeps them
+    exact. Extension types (e.g. UUID) are not supported by the CSV writer.
+    """
+    return (pa.types.is_null(data_type) or pa.types.is_decimal(data_type)
+            or pa.types.is_nested(data_type) or isinstance(data_type, pa.BaseExtensionType))
+
+def _value_to_text(value):
+    """Render one exported value as text, JSON-encoding nested values."""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value, default=str, ensure_ascii=False)
+    return str(value)
+
+def _text_array(array: pa.Array) -> pa.Array:
+    """Convert an Arrow array to text values without losing information."""
+    return pa.array([_value_to_text(v) for v in array.to_pylist()], type=pa.string())
+
+def _export_batch(batch: pa.RecordBatch) -> pa.RecordBatch:
+    """Convert the columns of a batch that are exported as text."""
+    arrays = [_text_array(array) if _is_text_export_type(array.type) and not pa.types.is_null(array.type)
+              else array for array in batch.columns]
+    return pa.RecordBatch.from_arrays(arrays, names=batch.schema.names)
+
+def _parquet_schema(batch: pa.RecordBatch) -> pa.Schema:
+    """Fix the Parquet file schema from the first batch.
+
+    Parquet needs one schema for the whole file but types are inferred per
+    batch, so all-NULL, decimal, nested and extension columns are declared
+    as text (see _is_text_export_type). Repeated column names get a numeric
+    suffix since Parquet readers match by name.
+    """
+    fields = []
+    seen = {}
+    for field in batch.schema:
+        count = seen.get(field.name, 0)
+        seen[field.name] = count + 1
+        if count:
+            field = field.with_name(f"{field.name}_{count}")
+        if _is_text_export_type(field.type):
+            field = field.with_type(pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+def _conform_batch(batch: pa.RecordBatch, schema: pa.Schema) -> pa.RecordBatch:
+    """Cast a record batch to the export schema, raising rather than losing data."""
+    arrays = []
+    for array, field in zip(batch.columns, schema):
+        if array.type != field.type:
+            if pa.types.is_string(field.type):
+                array = _text_array(array)
+            else:
+                try:
+                    # Safe cast: overflow, truncation and unknown conversions raise
+                    array = array.cast(field.type, safe=True)
+                except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+                    raise ValueError(
+                        f"Column '{field.name}' changed type from {field.type} to {array.type} "
+                        f"mid-export and cannot be converted without losing data: {e}"
+                    )
+        arrays.append(array)
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def _export_sources(query: str, batch_size: int = FETCH_BATCH_SIZE, job=None, shards: list = None):
+    """Yield (columns, record batches) for each database an export reads from.
+
+    Without shards this is the one routed connection. With shards each one
+    is streamed in turn with the _shard column added, so a single writer
+    receives every shard's rows while only one batch is in memory. Each
+    connection stays open until its batches have been consumed. Yields
+    (None, None) for a statement that returns no rows.
+    """
+    for name in shards or [None]:
+        with router.connect(query, engine_name=name) as conn:
+            result = _execute_streaming(conn, query, batch_size, job)
+            if not result.returns_rows:
+                yield None, None
+                return
+            columns = list(result.keys())
+            batches = iter_record_batches(result, batch_size, job)
+            if name is not None:
+                columns = columns + [SHARD_COLUMN]
+                batches = (_add_shard_column(batch, name, columns) for batch in batches)
+            yield columns, batches
+
+def export_sql(query: str, path: str, file_format: str = "csv", batch_size: int = FETCH_BATCH_SIZE,
+               progress_callback=None, job=None, fan_out: bool = False, shards: list = None):
+    """Stream SQL query results to a CSV or Parquet file and return stats or error message.
+
+    Rows come from a server-side cursor and each batch is written out as
+    soon as it is fetched, so memory stays bounded by ``batch_size`` no
+    matter how many rows the query returns. ``progress_callback`` is called
+    with the running stats dict after every batch. With ``fan_out`` the
+    query runs on every shard (like execute_sql_fanout) and all of their
+    rows go to the same file with a ``_shard`` column. When run by a
+    QueryJob the export gets its deadline and can be cancelled between
+    batches; the partial file is removed either way.
+    """
+    file_format = file_format.lower()
+    if file_format not in EXPORT_FORMATS:
+        return None, f"❌ Unsupported export format: {file_format}. Supported formats: CSV, Parquet"
+    if fan_out:
+        shards = shards or router.shards
+        error = _check_fanout(query, shards)
+        if error:
+            return None, error
+    else:
+        shards = None
+
+    stats = {"rows": 0, "batches": 0, "seconds": 0.0, "rows_per_second": 0.0, "bytes": 0}
+    start = time.perf_counter()
+    sources = _export_sources(query, batch_size, job, shards)
+    sink = None
+    parquet_writer = None
+    try:
+        export_columns = None
+        for columns, batches in sources:
+            if columns is None and sink is None:
+                return None, "❌ Query returned no rows to export."
+            if export_columns is None:
+                export_columns = columns
+                # Opened only once the query has produced a result set
+                sink = open(path, "wb")
+            elif columns != export_columns:
+                raise ValueError("Shards returned different columns")
+
+            for batch in batches:
+                if file_format == "csv":
+                    # Batches are written independently, so per-batch types need not match
+                    header = stats["batches"] == 0
+                    pa_csv.write_csv(_export_batch(batch), sink, pa_csv.WriteOptions(include_header=header))
+                else:
+                    if parquet_writer is None:
+                        parquet_writer = pq.ParquetWriter(sink, _parquet_schema(batch))
+                    parquet_writer.write_batch(_conform_batch(batch, parquet_writer.schema))
+
+                stats["rows"] += batch.num_rows
+                stats["batches"] += 1
+                stats["seconds"] = time.perf_counter() - start
+                stats["rows_per_second"] = stats["rows"] / stats["seconds"]
+                if progress_callback:
+                    progress_callback(dict(stats))
+
+        if stats["batches"] == 0:
+            # No rows: still produce a file carrying the column names
+            empty = _rows_to_record_batch(export_columns, [])
+            if file_format == "csv":
+                pa_csv.write_csv(empty, sink)
+            else:
+                parquet_writer = pq.ParquetWriter(sink, _parquet_schema(empty))
+        if parquet_writer is not None:
+            parquet_writer.close()
+            parquet_writer = None
+        sink.close()
+    except Exception as e:
+        if parquet_writer is not None:
+            try:
+                parquet_writer.close()
+            except Exception:
+                pass
+        if sink is not None:
+            sink.close()
+            # Never leave a truncated export behind that looks like a complete one
+            if os.path.exists(path):
+                os.remove(path)
+        return None, f"❌ Error exporting query: {str(e)}"
+    finally:
+        # Releases the connection still open inside the generator when the export stops early
+        sources.close()
+
+    stats["seconds"] = time.perf_counter() - start
+    stats["rows_per_second"] = stats["rows"] / stats["seconds"] if stats["seconds"] else 0.0
+    stats["bytes"] = os.path.getsize(path)
+    return stats, (
+        f"✅ Exported {stats['rows']} rows to {path} in {stats['seconds']:.2f}s "
+        f"({stats['rows_per_second']:,.0f} rows/s, {stats['bytes'] / 1e6:.1f} MB)"
+    )
+
+# Default per-query deadline in seconds (0 disables it)
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "60"))
+
+# Overall deadline for exports in seconds (0, the default, lets large exports run to completion).
+# Each statement an export sends is still limited by DB_QUERY_TIMEOUT.
+DB_EXPORT_TIMEOUT = float(os.getenv("DB_EXPORT_TIMEOUT", "0"))
+
+class QueryCancelled(Exception):
+    """Raised inside a running query job once it has been cancelled."""
+
+class QueryJob:
+    """Run a query in a background thread with a deadline and server-side cancellation.
+
+    ``target`` is execute_sql_arrow, execute_sql_fanout or export_sql, and
+    result() returns whatever it returns. Every connection
+    the target opens is attached to the job; cancel() interrupts the
+    statement running on each of them through the driver (pg_cancel_backend
+    when the driver has no cancel), so the database stops working on it.
+    The deadline is enforced both as the transaction's statement_timeout and
+    by a client-side timer that cancels the job. ``statement_timeout`` sets
+    the per-statement limit separately, for jobs such as exports that send
+    many statements (one FETCH per batch) and may have no overall deadline.
+    """
+
+    def __init__(self, query: str, target=None, timeout: float = DB_QUERY_TIMEOUT,
+                 statement_timeout: float = None, **kwargs):
+        self.query = query
+        self.target = target or execute_sql_arrow
+        self.timeout = timeout
+        self.statement_timeout = timeout if statement_timeout is None else statement_timeout
+        self.kwargs = kwargs
+        self.cancelled = False
+        self.timed_out = False
+        self.started_at = None
+        self.finished_at = None
+        self._connections = []
+        # Connections whose main statement has been sent; only these have anything to cancel
+        self._running = set()
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._result = None
+        self._timer = None
+
+    def start(self):
+        """Start running the query in the background and return the job."""
+        self.started_at = time.monotonic()
+        threading.Thread(target=self._run, daemon=True).start()
+        if self.timeout:
+            self._timer = threading.Timer(self.timeout, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def _run(self):
+        try:
+            columns, result = self.target(self.query, job=self, **self.kwargs)
+        except Exception as e:
+            columns, result = None, f"❌ Error executing query: {str(e)}"
+        if columns is None and self.timeout and time.monotonic() - self.started_at >= self.timeout:
+            # statement_timeout may fire on the server just before the client-side timer
+            self.timed_out = True
+        if self.timed_out:
+            columns, result = None, f"⏱️ Query exceeded the {self.timeout:g}s limit and was cancelled."
+        elif self.cancelled:
+            columns, result = None, "🛑 Query cancelled."
+        self._result = (columns, result)
+        self.finished_at = time.monotonic()
+        if self._timer:
+            self._timer.cancel()
+        self._done.set()
+
+    def attach(self, conn):
+        """Register a connection the job runs on and apply the deadline to it."""
+        dbapi_connection = conn.connection.dbapi_connection
+        backend_pid = None
+        if conn.dialect.name == "postgresql":
+            if self.statement_timeout:
+                # Local to the query's transaction, so pooled connections are unaffected
+                conn.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                             {"ms": str(int(self.statement_timeout * 1000))})
+            if not hasattr(dbapi_connection, "cancel"):
+                backend_pid = conn.execute(text("SELECT pg_backend_pid()")).scalar()
+        with self._lock:
+            self._connections.append((conn.engine, dbapi_connection, backend_pid))
+        self.check_cancelled()
+
+    def execute(self, conn, statement, **options):
+        """Run the job's main statement on an attached connection.
+
+        The cancelled check and marking the connection as running happen
+        under the lock cancel() takes, so a cancel either refuses the
+        statement here or is sent to a connection that is running it.
+        """
+        with self._lock:
+            self.check_cancelled()
+            self._running.add(id(conn.connection.dbapi_connection))
+        return conn.execution_options(**options).execute(statement)
+
+    def check_cancelled(self):
+        """Stop the running query if the job has been cancelled."""
+        if self.cancelled:
+            raise QueryCancelled()
+
+    def cancel(self) -> bool:
+        """Cancel the query on the server; returns False if it had already finished."""
+        with self._lock:
+            if self._done.is_set():
+                return False
+            self.cancelled = True
+            connections = [c for c in self._connections if id(c[1]) in self._running]
+        for conn_engine, dbapi_connection, backend_pid in connections:
+            try:
+                if backend_pid is None:
+                    dbapi_connection.cancel()
+                else:
+                    with conn_engine.connect() as conn:
+                        conn.execute(text("SELECT pg_cancel_backend(:pid)"), {"pid": backend_pid})
+            except Exception:
+                # The statement may have just finished; nothing left to cancel
+                pass
+        return True
+
+    def _expire(self):
+        if not self._done.is_set():
+            self.timed_out = True
+            self.cancel()
+
+    def done(self) -> bool:
+        """Check whether the query has finished, failed or been cancelled."""
+        return self._done.is_set()
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds the query has been running (or ran for)."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def result(self, timeout: float = None):
+        """Wait for the query and return the target's result, e.g. (columns, table) or (None, message)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        # Wait in short steps so Ctrl-C reaches the main thread promptly
+        while not self._done.wait(0.2):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("Query is still running")
+        return self._result
+
+def execute_sql_async(query: str, timeout: float = DB_QUERY_TIMEOUT, fan_out: bool = False, **kwargs) -> QueryJob:
+    """Start running a query in the background and return its QueryJob."""
+    target = execute_sql_fanout if fan_out else execute_sql_arrow
+    return QueryJob(query, target, timeout, **kwargs).start()
+
+def export_sql_async(query: str, path: str, file_format: str = "csv",
+                     timeout: float = DB_EXPORT_TIMEOUT, **kwargs) -> QueryJob:
+    """Start exporting a query's results in the background and return its QueryJob.
+
+    The export has no overall deadline unless ``timeout`` is given, but every
+    statement it sends is limited by DB_QUERY_TIMEOUT. result() returns
+    (stats, message) like export_sql.
+    """
+    return QueryJob(query, export_sql, timeout, statement_timeout=DB_QUERY_TIMEOUT,
+                    path=path, file_format=file_format, **kwargs).start()
@@ -0,0 +1,331 @@
+import codecs
+import io
+import json
+import mmap
+import os
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from html.parser import HTMLParser
+from typing import Any, Callable, Dict, Iterator, List, Union
+
+import PyPDF2
+import pandas as pd
+from docx import Document
+from docx.table import Table
+from docx.text.paragraph import Paragraph
+
+# Anything an extractor can read from: raw bytes, a buffer view, or a file path
+Source = Union[bytes, bytearray, memoryview, str, os.PathLike]
+
+# Bytes decoded per step when streaming text formats
+TEXT_CHUNK_SIZE = 1 << 16
+
+# Rows formatted per segment for tabular formats
+ROWS_PER_SEGMENT = 200
+
+
+@dataclass
+class TextSegment:
+    """A piece of extracted text plus where it came from in the document"""
+    text: str
+    location: Dict[str, Any] = field(default_factory=dict)
+
+
+# Registry of extractors keyed by file extension
+EXTRACTORS: Dict[str, Callable[[io.RawIOBase], Iterator[TextSegment]]] = {}
+
+
+def register_extractor(*file_types: str):
+    """
+    Register a function as the extractor for one or more file types
+
+    The function receives a seekable binary stream over the file content
+    and yields TextSegment objects in document order.
+    """
+    def decorator(func):
+        for file_type in file_types:
+            EXTRACTORS[file_type.lower()] = func
+        return func
+    return decorator
+
+
+def supported_file_types() -> List[str]:
+    """Get the list of registered file extensions"""
+    return sorted(EXTRACTORS)
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable read-only stream over a buffer (bytes, memoryview or mmap) without copying it"""
+
+    def __init__(self, buffer):
+        self._view = memoryview(buffer).cast("B")
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._view[self._pos:self._pos + len(b)]
+        n = len(data)
+        b[:n] = data
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        elif whence == io.SEEK_END:
+            self._pos = len(self._view) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        self._pos = max(self._pos, 0)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+@contextmanager
+def open_source(source: Source):
+    """
+    Open a source as a seekable binary stream
+
+    Bytes and memoryviews are read in place; file paths are memory-mapped,
+    so the file content is never copied into a Python bytes object.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as file:
+            if os.fstat(file.fileno()).st_size == 0:
+                # Empty files cannot be memory-mapped
+                yield io.BufferedReader(BufferReader(b""))
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                stream = BufferReader(mapped)
+                try:
+                    yield io.BufferedReader(stream)
+                finally:
+                    # The view must be released before the mmap can close
+                    stream.close()
+    else:
+        stream = BufferReader(source)
+        try:
+            yield io.BufferedReader(stream)
+        finally:
+            stream.close()
+
+
+def extract_segments(source: Source, file_type: str) -> Iterator[TextSegment]:
+    """
+    Stream text segments from a source using the extractor registered for file_type
+
+    Args:
+        source: File content as bytes/memoryview, or a path to the file
+        file_type: File extension (pdf, txt, csv, docx, ...)
+
+    Yields:
+        TextSegment objects in document order
+    """
+    extractor = EXTRACTORS.get(file_type.lower())
+    if extractor is None:
+        supported = ", ".join(t.upper() for t in supported_file_types())
+        raise ValueError(f"Unsupported file type: {file_type}. Supported types: {supported}")
+
+    with open_source(source) as stream:
+        yield from extractor(stream)
+
+
+def _detect_encoding(stream) -> str:
+    """Check whether a stream is valid UTF-8, falling back to latin-1"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    try:
+        while True:
+            chunk = stream.read(TEXT_CHUNK_SIZE)
+            if not chunk:
+                decoder.decode(b"", final=True)
+                return 'utf-8'
+            decoder.decode(chunk)
+    except UnicodeDecodeError:
+        return 'latin-1'
+    finally:
+        stream.seek(0)
+
+
+def _iter_text(stream) -> Iterator[str]:
+    """Decode a binary stream chunk by chunk"""
+    decoder = codecs.getincrementaldecoder(_detect_encoding(stream))()
+    while True:
+        chunk = stream.read(TEXT_CHUNK_SIZE)
+        if not chunk:
+            tail = decoder.decode(b"", final=True)
+            if tail:
+                yield tail
+            return
+        yield decoder.decode(chunk)
+
+
+@register_extractor('txt', 'md')
+def extract_txt(stream) -> Iterator[TextSegment]:
+    """Yield blank-line separated paragraphs of a plain text file"""
+    paragraph_lines = []
+    paragraph = 0
+    pending = ""
+    for chunk in _iter_text(stream):
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            if line.strip():
+                paragraph_lines.append(line.rstrip("\r"))
+            elif paragraph_lines:
+                paragraph += 1
+                yield TextSegment("\n".join(paragraph_lines), {'paragraph': paragraph})
+                paragraph_lines = []
+    if pending.strip():
+        paragraph_lines.append(pending.rstrip("\r"))
+    if paragraph_lines:
+        paragraph += 1
+        yield TextSegment("\n".join(paragraph_lines), {'paragraph': paragraph})
+
+
+@register_extractor('pdf')
+def extract_pdf(stream) -> Iterator[TextSegment]:
+    """Yield the text of each PDF page"""
+    reader = PyPDF2.PdfReader(stream)
+    for page_number, page in enumerate(reader.pages, 1):
+        page_text = page.extract_text()
+        if page_text and page_text.strip():
+            yield TextSegment(page_text.strip(), {'page': page_number})
+
+
+@register_extractor('csv')
+def extract_csv(stream) -> Iterator[TextSegment]:
+    """Yield CSV rows as formatted tables, ROWS_PER_SEGMENT rows at a time"""
+    encoding = _detect_encoding(stream)
+    for chunk in pd.read_csv(stream, chunksize=ROWS_PER_SEGMENT, encoding=encoding):
+        yield TextSegment(chunk.to_string(), {'row': int(chunk.index[0]) + 1, 'rows': len(chunk)})
+
+
+@register_extractor('docx')
+def extract_docx(stream) -> Iterator[TextSegment]:
+    """Yield DOCX paragraphs and table rows in document order"""
+    doc = Document(stream)
+    paragraph = 0
+    table = 0
+    for element in doc.element.body.iterchildren():
+        tag = element.tag.rsplit('}', 1)[-1]
+        if tag == 'p':
+            text = Paragraph(element, doc).text
+            if text.strip():
+                paragraph += 1
+                yield TextSegment(text, {'paragraph': paragraph})
+        elif tag == 'tbl':
+            table += 1
+            for row_number, row in enumerate(Table(element, doc).rows, 1):
+                cells = [cell.text.strip() for cell in row.cells]
+                if any(cells):
+                    yield TextSegment(" | ".join(cells), {'table': table, 'row': row_number})
+
+
+@register_extractor('xlsx')
+def extract_xlsx(stream) -> Iterator[TextSegment]:
+    """Yield worksheet rows, reading the workbook in streaming mode"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(stream, read_only=True, data_only=True)
+    try:
+        for sheet in workbook.worksheets:
+            for row_number, row in enumerate(sheet.iter_rows(values_only=True), 1):
+                cells = ["" if value is None else str(value) for value in row]
+                if any(cells):
+                    yield TextSegment(" | ".join(cells), {'sheet': sheet.title, 'row': row_number})
+    finally:
+        workbook.close()
+
+
+@register_extractor('pptx')
+def extract_pptx(stream) -> Iterator[TextSegment]:
+    """Yield the text of each slide"""
+    from pptx import Presentation
+
+    presentation = Presentation(stream)
+    for slide_number, slide in enumerate(presentation.slides, 1):
+        texts = [shape.text_frame.text for shape in slide.shapes
+                 if shape.has_text_frame and shape.text_frame.text.strip()]
+        if texts:
+            yield TextSegment("\n".join(texts), {'slide': slide_number})
+
+
+class _HTMLTextParser(HTMLParser):
+    """Collect visible text of an HTML document, one entry per block element"""
+
+    BLOCK_TAGS = {'p', 'div', 'li', 'tr', 'br', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                  'section', 'article', 'table', 'title', 'pre', 'blockquote'}
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks = []
+        self._current = []
+        self._skip_depth = 0
+
+    def _flush(self):
+        text = " ".join("".join(self._current).split())
+        if text:
+            self.blocks.append(text)
+        self._current = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag in self.BLOCK_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._current.append(data)
+
+
+@register_extractor('html', 'htm')
+def extract_html(stream) -> Iterator[TextSegment]:
+    """Yield visible text blocks of an HTML page"""
+    parser = _HTMLTextParser()
+    block = 0
+    for chunk in _iter_text(stream):
+        parser.feed(chunk)
+        for text in parser.blocks:
+            block += 1
+            yield TextSegment(text, {'block': block})
+        parser.blocks = []
+    parser.close()
+    parser._flush()
+    for text in parser.blocks:
+        block += 1
+        yield TextSegment(text, {'block': block})
+
+
+@register_extractor('json')
+def extract_json(stream) -> Iterator[TextSegment]:
+    """Yield one segment per top-level key or array item of a JSON document"""
+    data = json.loads("".join(_iter_text(stream)))
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield TextSegment(f"{key}: {json.dumps(value, ensure_ascii=False)}", {'key': key})
+    elif isinstance(data, list):
+        for index, item in enumerate(data):
+            yield TextSegment(json.dumps(item, ensure_ascii=False), {'item': index})
+    else:
+        yield TextSegment(json.dumps(data, ensure_ascii=False), {})
@@ -1,21 +1,76 @@
 import os
-import PyPDF2
-import pandas as pd
-from docx import Document
-import io
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Tuple, Union
 from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
+from extractors import EXTRACTORS, Source, extract_segments, supported_file_types
 
 load_dotenv()
 
+# Rough characters-per-token ratio used to estimate prompt sizes
+CHARS_PER_TOKEN = 4
+
+# Token budget for conversation history (summary + recent turns) sent each turn
+MEMORY_TOKEN_BUDGET = 1000
+
+# Prompt for document Q&A; only context, history and question vary
+DOCUMENT_CHAT_PROMPT = ChatPromptTemplate.from_template("""
+You are a helpful assistant that answers questions based on the provided context from uploaded documents.
+
+CONTEXT FROM UPLOADED DOCUMENTS:
+{context}
+
+CONVERSATION SO FAR:
+{history}
+
+USER QUESTION:
+{question}
+
+INSTRUCTIONS:
+- Answer the question based ONLY on the context provided
+- Use the conversation so far only to understand follow-up questions
+- Be concise and factual
+- If the context doesn't contain relevant information to answer the question, say "I cannot find this information in the uploaded documents."
+- Do not make up information or use external knowledge
+- If the question is ambiguous, ask for clarification based on the available context
+
+ANSWER:
+""")
+
+# Prompt used to fold older turns into the rolling conversation summary
+SUMMARY_PROMPT = ChatPromptTemplate.from_template("""
+Update the summary of a conversation about some uploaded documents.
+
+CURRENT SUMMARY:
+{summary}
+
+NEW CONVERSATION TURNS:
+{turns}
+
+Write an updated summary in at most {max_words} words. Keep the facts, names and numbers needed to answer follow-up questions. Return ONLY the summary.
+""")
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the number of tokens in a piece of text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
 class FileProcessor:
     def __init__(self):
         self.uploaded_files_content = []
         self.uploaded_files_info = []
         
+        # Bumped whenever the set of documents changes, invalidating the cached chain
+        self.corpus_version = 0
+        self._chat_chain = None
+        self._chat_chain_version = None
+        self._context_tokens = 0
+        
+        # Conversation memory: rolling summary plus the most recent turns
+        self.conversation_summary = ""
+        self.recent_turns = []
+        self.last_turn_usage = {}
+        
         # Initialize LLM for file chat
         groq_api_key = os.getenv("GROQ_API_KEY")
         if not groq_api_key:
@@ -27,148 +82,81 @@ class FileProcessor:
             groq_api_key=groq_api_key
         )
     
-    def read_pdf(self, file_content: bytes) -> str:
-        """Read text from PDF file content"""
-        try:
-            pdf_file = io.BytesIO(file_content)
-            reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in reader.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-            return text.strip()
-        except Exception as e:
-            raise Exception(f"Error reading PDF: {str(e)}")
-    
-    def read_pdf_from_path(self, file_path: str) -> str:
-        """Read text from PDF file using file path"""
-        try:
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-                return text.strip()
-        except Exception as e:
-            raise Exception(f"Error reading PDF: {str(e)}")
-    
-    def read_txt(self, file_content: bytes) -> str:
-        """Read text from TXT file content"""
-        try:
-            # Try UTF-8 first, then fallback to other encodings
-            try:
-                return file_content.decode('utf-8').strip()
-            except UnicodeDecodeError:
-                return file_content.decode('latin-1').strip()
-        except Exception as e:
-            raise Exception(f"Error reading text file: {str(e)}")
-    
-    def read_txt_from_path(self, file_path: str) -> str:
-        """Read text from TXT file using file path"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                return file.read().strip()
-        except UnicodeDecodeError:
-            with open(file_path, 'r', encoding='latin-1') as file:
-                return file.read().strip()
-        except Exception as e:
-            raise Exception(f"Error reading text file: {str(e)}")
-    
-    def read_csv(self, file_content: bytes) -> str:
-        """Read text from CSV file content"""
-        try:
-            csv_file = io.BytesIO(file_content)
-            df = pd.read_csv(csv_file)
-            return df.to_string()
-        except Exception as e:
-            raise Exception(f"Error reading CSV: {str(e)}")
-    
-    def read_csv_from_path(self, file_path: str) -> str:
-        """Read text from CSV file using file path"""
-        try:
-            df = pd.read_csv(file_path)
-            return df.to_string()
-        except Exception as e:
-            raise Exception(f"Error reading CSV: {str(e)}")
-    
-    def read_docx(self, file_content: bytes) -> str:
-        """Read text from DOCX file content"""
-        try:
-            docx_file = io.BytesIO(file_content)
-            doc = Document(docx_file)
-            text = ""
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            return text.strip()
-        except Exception as e:
-            raise Exception(f"Error reading DOCX: {str(e)}")
+    def extract_text(self, source: Source, file_type: str) -> Tuple[str, int]:
+        """
+        Extract the full text of a file through the extractor registry
+        
+        Args:
+            source: File content as bytes/memoryview, or a path to the file
+            file_type: File extension (pdf, txt, csv, docx, ...)
+            
+        Returns:
+            Tuple of the extracted text and the number of segments it was built from
+        """
+        parts = []
+        segment_count = 0
+        previous = None
+        for segment in extract_segments(source, file_type):
+            if previous is not None:
+                # Keep blank lines between paragraphs; other segments are line-separated
+                is_paragraph_break = 'paragraph' in previous.location and 'paragraph' in segment.location
+                parts.append("\n\n" if is_paragraph_break else "\n")
+            parts.append(segment.text)
+            segment_count += 1
+            previous = segment
+        return "".join(parts).strip(), segment_count
     
-    def read_docx_from_path(self, file_path: str) -> str:
-        """Read text from DOCX file using file path"""
+    def _process_source(self, file_name: str, source: Source, file_type: str) -> str:
+        """Extract a file's text and store it alongside its info"""
+        # Check if file is already processed
+        if self.is_file_processed(file_name):
+            return f"ℹ️ File {file_name} is already uploaded and processed"
+        
+        file_type = file_type.lower()
+        if file_type not in EXTRACTORS:
+            supported = ", ".join(t.upper() for t in supported_file_types())
+            return f"❌ Unsupported file type: {file_type}. Supported types: {supported}"
+        
         try:
-            doc = Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    text += paragraph.text + "\n"
-            return text.strip()
+            content, segment_count = self.extract_text(source, file_type)
         except Exception as e:
-            raise Exception(f"Error reading DOCX: {str(e)}")
+            raise Exception(f"Error reading {file_type.upper()}: {str(e)}")
+        
+        # Check if content was extracted successfully
+        if not content:
+            return f"⚠️ No readable content found in {file_name}. The file might be empty, corrupted, or contain only images."
+        
+        # Create content preview (first 200 characters)
+        content_preview = content[:200] + "..." if len(content) > 200 else content
+        
+        # Store file content and info
+        self.corpus_version += 1
+        self.uploaded_files_content.append(content)
+        self.uploaded_files_info.append({
+            'name': file_name,
+            'size': len(content),
+            'segments': segment_count,
+            'content_preview': content_preview,
+            'type': file_type.upper(),
+            'processed': True
+        })
+        
+        return f"✅ Successfully processed {file_name} ({len(content)} characters)"
     
-    def process_uploaded_file(self, file_name: str, file_content: bytes, file_type: str) -> str:
+    def process_uploaded_file(self, file_name: str, file_content: Union[bytes, memoryview], file_type: str) -> str:
         """
         Process uploaded file directly from Streamlit file uploader
         
         Args:
             file_name: Name of the uploaded file
-            file_content: Binary content of the file
-            file_type: File extension (pdf, txt, csv, docx)
+            file_content: Binary content of the file (bytes or memoryview, read without copying)
+            file_type: File extension (pdf, txt, csv, docx, ...)
             
         Returns:
             Success or error message
         """
         try:
-            # Check if file is already processed
-            existing_files = [f['name'] for f in self.uploaded_files_info]
-            if file_name in existing_files:
-                return f"ℹ️ File {file_name} is already uploaded and processed"
-            
-            # Process based on file type
-            content = ""
-            if file_type == 'pdf':
-                content = self.read_pdf(file_content)
-            elif file_type == 'txt':
-                content = self.read_txt(file_content)
-            elif file_type == 'csv':
-                content = self.read_csv(file_content)
-            elif file_type in ['docx', 'doc']:
-                content = self.read_docx(file_content)
-            else:
-                return f"❌ Unsupported file type: {file_type}. Supported types: PDF, TXT, CSV, DOCX"
-            
-            # Check if content was extracted successfully
-            if not content or len(content.strip()) == 0:
-                return f"⚠️ No readable content found in {file_name}. The file might be empty, corrupted, or contain only images."
-            
-            # Create content preview (first 200 characters)
-            content_preview = content[:200] + "..." if len(content) > 200 else content
-            
-            # Store file content and info
-            self.uploaded_files_content.append(content)
-            self.uploaded_files_info.append({
-                'name': file_name,
-                'size': len(content),
-                'content_preview': content_preview,
-                'type': file_type.upper(),
-                'processed': True
-            })
-            
-            return f"✅ Successfully processed {file_name} ({len(content)} characters)"
-            
+            return self._process_source(file_name, file_content, file_type)
         except Exception as e:
             return f"❌ Error processing file {file_name}: {str(e)}"
     
@@ -177,7 +165,7 @@ class FileProcessor:
         Process file from local file path (for command-line interface)
         
         Args:
-            file_path: Path to the file to process
+            file_path: Path to the file to process (memory-mapped, not read into memory)
             
         Returns:
             Success or error message
@@ -191,49 +179,72 @@ class FileProcessor:
             file_name = os.path.basename(file_path)
             file_extension = os.path.splitext(file_path)[1].lower().replace('.', '')
             
-            # Check if file is already processed
-            existing_files = [f['name'] for f in self.uploaded_files_info]
-            if file_name in existing_files:
-                return f"ℹ️ File {file_name} is already uploaded and processed"
-            
-            # Process based on file type
-            content = ""
-            if file_extension == 'pdf':
-                content = self.read_pdf_from_path(file_path)
-            elif file_extension == 'txt':
-                content = self.read_txt_from_path(file_path)
-            elif file_extension == 'csv':
-                content = self.read_csv_from_path(file_path)
-            elif file_extension in ['docx', 'doc']:
-                content = self.read_docx_from_path(file_path)
-            else:
-                return f"❌ Unsupported file type: {file_extension}. Supported types: PDF, TXT, CSV, DOCX"
-            
-            # Check if content was extracted successfully
-            if not content or len(content.strip()) == 0:
-                return f"⚠️ No readable content found in {file_name}. The file might be empty, corrupted, or contain only images."
-            
-            # Create content preview (first 200 characters)
-            content_preview = content[:200] + "..." if len(content) > 200 else content
-            
-            # Store file content and info
-            self.uploaded_files_content.append(content)
-            self.uploaded_files_info.append({
-                'name': file_name,
-                'size': len(content),
-                'content_preview': content_preview,
-                'type': file_extension.upper(),
-                'processed': True
-            })
-            
-            return f"✅ Successfully processed {file_name} ({len(content)} characters)"
-            
+            return self._process_source(file_name, file_path, file_extension)
         except Exception as e:
             return f"❌ Error processing file {file_path}: {str(e)}"
     
+    def _get_chat_chain(self):
+        """
+        Get the document chat chain with the document context already filled in
+        
+        The context is joined and bound to the prompt once per corpus version,
+        so repeated questions over the same documents reuse it.
+        """
+        if self._chat_chain is None or self._chat_chain_version != self.corpus_version:
+            context = "\n\n".join(
+                f"--- Document {i+1}: {file_info['name']} ---\n{content}"
+                for i, (content, file_info) in enumerate(zip(self.uploaded_files_content, self.uploaded_files_info))
+            )
+            self._context_tokens = estimate_tokens(context)
+            self._chat_chain = DOCUMENT_CHAT_PROMPT.partial(context=context) | self.llm
+            self._chat_chain_version = self.corpus_version
+        return self._chat_chain
+    
+    def _format_history(self) -> str:
+        """Format the conversation summary and recent turns for the prompt"""
+        parts = []
+        if self.conversation_summary:
+            parts.append(f"Summary of earlier conversation: {self.conversation_summary}")
+        for question, answer in self.recent_turns:
+            parts.append(f"User: {question}\nAssistant: {answer}")
+        return "\n\n".join(parts) if parts else "(no previous conversation)"
+    
+    def _compact_memory(self):
+        """Fold the oldest turns into the summary until the history fits its token budget"""
+        if estimate_tokens(self._format_history()) <= MEMORY_TOKEN_BUDGET:
+            return
+        
+        # Keep the latest turn verbatim and summarize everything older
+        old_turns, self.recent_turns = self.recent_turns[:-1], self.recent_turns[-1:]
+        max_words = MEMORY_TOKEN_BUDGET // 4
+        if old_turns:
+            turns = "\n\n".join(f"User: {q}\nAssistant: {a}" for q, a in old_turns)
+            try:
+                chain = SUMMARY_PROMPT | self.llm | StrOutputParser()
+                summary = chain.invoke({
+                    "summary": self.conversation_summary or "(empty)",
+                    "turns": turns,
+                    "max_words": max_words
+                }).strip()
+            except Exception:
+                # Without a summary the old turns are simply dropped
+                summary = self.conversation_summary
+            
+            # Hard cap in case the model ignores the word limit
+            self.conversation_summary = summary[:max_words * CHARS_PER_TOKEN]
+        
+        # A single very long turn may still not fit; trim its answer
+        while self.recent_turns and estimate_tokens(self._format_history()) > MEMORY_TOKEN_BUDGET:
+            question, answer = self.recent_turns[-1]
+            overflow = (estimate_tokens(self._format_history()) - MEMORY_TOKEN_BUDGET) * CHARS_PER_TOKEN
+            if overflow >= len(answer):
+                self.recent_turns.pop()
+            else:
+                self.recent_turns[-1] = (question, answer[:len(answer) - overflow] + "...")
+    
     def chat_with_files(self, question: str) -> str:
         """
-        Chat with the uploaded documents using simple context
+        Chat with the uploaded documents, remembering earlier turns of the conversation
         
         Args:
             question: User's question about the uploaded files
@@ -241,57 +252,59 @@ class FileProcessor:
         Returns:
             AI response based on the file content
         """
+        # A failed turn has no usage to report, so the previous turn's must not linger
+        self.last_turn_usage = {}
         if not self.uploaded_files_content:
             return "❌ No documents have been uploaded yet. Please upload files first."
         
         try:
-            # Combine all file contents as context
-            context_parts = []
-            for i, content in enumerate(self.uploaded_files_content):
-                file_info = self.uploaded_files_info[i]
-                context_parts.append(f"--- Document {i+1}: {file_info['name']} ---\n{content}")
-            
-            context = "\n\n".join(context_parts)
-            
-            # Create prompt for document Q&A
-            prompt = ChatPromptTemplate.from_template("""
-            You are a helpful assistant that answers questions based on the provided context from uploaded documents.
-            
-            CONTEXT FROM UPLOADED DOCUMENTS:
-            {context}
-            
-            USER QUESTION:
-            {question}
-            
-            INSTRUCTIONS:
-            - Answer the question based ONLY on the context provided
-            - Be concise and factual
-            - If the context doesn't contain relevant information to answer the question, say "I cannot find this information in the uploaded documents."
-            - Do not make up information or use external knowledge
-            - If the question is ambiguous, ask for clarification based on the available context
-            
-            ANSWER:
-            """)
-            
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({
-                "context": context,
+            chain = self._get_chat_chain()
+            history = self._format_history()
+            message = chain.invoke({
+                "history": history,
                 "question": question
             })
+            response = message.content
+            
+            # Report how large this turn was; actual counts come from the API when available
+            usage = getattr(message, 'usage_metadata', None) or {}
+            self.last_turn_usage = {
+                'context_tokens': self._context_tokens,
+                'history_tokens': estimate_tokens(history),
+                'question_tokens': estimate_tokens(question),
+                'input_tokens': usage.get('input_tokens'),
+                'output_tokens': usage.get('output_tokens')
+            }
+            
+            self.recent_turns.append((question, response))
+            self._compact_memory()
             
             return response
             
         except Exception as e:
             return f"❌ Error during chat: {str(e)}"
     
+    def get_last_turn_usage(self) -> Dict[str, Any]:
+        """Get token counts for the most recent chat turn"""
+        return self.last_turn_usage
+    
+    def clear_memory(self) -> str:
+        """Forget the conversation so far"""
+        self.conversation_summary = ""
+        self.recent_turns.clear()
+        self.last_turn_usage = {}
+        return "✅ Conversation memory cleared"
+    
     def get_uploaded_files(self) -> List[Dict]:
         """Get list of uploaded files with their information"""
         return self.uploaded_files_info
     
     def clear_files(self) -> str:
         """Clear all uploaded files from memory"""
+        self.corpus_version += 1
         self.uploaded_files_content.clear()
         self.uploaded_files_info.clear()
+        self.clear_memory()
         return "✅ All files cleared from memory"
     
     def has_files(self) -> bool:
@@ -328,6 +341,7 @@ class FileProcessor:
                 return f"❌ File {file_name} not found in uploaded files"
             
             # Remove file content and info
+            self.corpus_version += 1
             self.uploaded_files_content.pop(file_index)
             self.uploaded_files_info.pop(file_index)
             
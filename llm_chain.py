@@ -3,6 +3,8 @@ from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from dotenv import load_dotenv
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables
 load_dotenv()
@@ -17,6 +19,13 @@ llm = ChatGroq(
     groq_api_key=groq_api_key
 )
 
+# Sampling LLM for alternative SQL candidates; temperature makes them differ
+candidate_llm = ChatGroq(
+    model="llama-3.1-8b-instant",
+    temperature=0.7,
+    groq_api_key=groq_api_key
+)
+
 # Create SQL prompt
 sql_prompt = ChatPromptTemplate.from_template("""
 You are an expert in writing PostgreSQL SQL queries. Convert the following natural language question into a correct SQL query.
@@ -37,4 +46,54 @@ def natural_to_sql(question: str) -> str:
         sql_query = sql_chain.invoke({"question": question})
         return sql_query.strip()
     except Exception as e:
-        return f"-- Error generating SQL: {str(e)}"
\ No newline at end of file
+        return f"-- Error generating SQL: {str(e)}"
+
+# Number of SQL candidates generated when comparing query plans
+DEFAULT_CANDIDATES = 3
+
+# Candidate chain shares the prompt but samples instead of decoding greedily
+candidate_chain = sql_prompt | candidate_llm | parser
+
+def _clean_sql(sql_query: str) -> str:
+    """Strip markdown code fences the model sometimes wraps around SQL."""
+    match = re.search(r"```(?:sql)?\s*(.*?)```", sql_query, re.DOTALL | re.IGNORECASE)
+    return (match.group(1) if match else sql_query).strip()
+
+# Quoted string literals and identifiers, whose case and spacing are significant
+_QUOTED_SQL_RE = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+
+def _dedupe_key(sql_query: str) -> str:
+    """Normalize whitespace and keyword case, leaving quoted literals untouched."""
+    parts = _QUOTED_SQL_RE.split(sql_query)
+    # split() with a capturing group puts the quoted parts at odd indexes
+    normalized = "".join(part if i % 2 else re.sub(r"\s+", " ", part.lower()) for i, part in enumerate(parts))
+    return normalized.strip().rstrip(";").strip()
+
+def natural_to_sql_candidates(question: str, n: int = DEFAULT_CANDIDATES) -> tuple:
+    """Generate up to n distinct SQL candidates for a question concurrently.
+
+    The first candidate is the usual deterministic answer; the rest are sampled.
+    Duplicates are dropped. Returns (candidates, errors), where errors holds
+    the message of every generation that failed, so an unreachable model is
+    not mistaken for queries the database rejected.
+    """
+    chains = [sql_chain] + [candidate_chain] * (n - 1)
+    with ThreadPoolExecutor(max_workers=n) as pool:
+        futures = [pool.submit(chain.invoke, {"question": question}) for chain in chains]
+
+    candidates = []
+    errors = []
+    seen = set()
+    for future in futures:
+        try:
+            sql_query = _clean_sql(future.result())
+        except Exception as e:
+            message = f"Error generating SQL: {str(e)}"
+            if message not in errors:
+                errors.append(message)
+            continue
+        key = _dedupe_key(sql_query)
+        if sql_query and key not in seen:
+            seen.add(key)
+            candidates.append(sql_query)
+    return candidates, errors
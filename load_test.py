@@ -0,0 +1,294 @@
+"""
+Concurrent-user load test for the assistant's session logic
+
+Simulates N Streamlit sessions at once, each with its own FileProcessor,
+running the same steps as the app: upload documents, chat about them and
+ask a Text-to-SQL question. The Groq LLM is replaced by a fake model with
+configurable latency and SQL runs against a local database (SQLite by
+default, or any SQLAlchemy URL via --db-url), so the numbers reflect the
+app's own overhead rather than the network.
+
+Memory per session is what each level's sessions still hold once they are
+done (uploaded text, cached prompts, chat memory): Python objects measured
+with tracemalloc plus Arrow buffers from pyarrow's allocator, which
+tracemalloc cannot see. Arrow's peak is sampled while the level runs, so
+short spikes can be missed; other native memory (driver buffers, mapped
+files) is not counted. Tracing slows allocation-heavy steps such as
+uploads, so compare latencies between levels rather than against
+production.
+
+Example:
+    python load_test.py --concurrency 1,5,10,25 --chat-turns 3 --doc-kb 200
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import pyarrow as pa
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from sqlalchemy import create_engine, text
+from tabulate import tabulate
+
+# Result strings the app returns instead of raising; these count as failed operations
+ERROR_PREFIXES = ("❌", "⚠️", "-- Error generating SQL", "⏱️", "🛑")
+
+# Seconds between samples of Arrow's allocated bytes
+ARROW_SAMPLE_INTERVAL = 0.01
+
+
+class FakeLLM(BaseChatModel):
+    """Chat model stand-in that sleeps for a while and returns a canned answer"""
+    response: str = "This is a simulated answer based on the uploaded documents."
+    latency: float = 0.2
+    jitter: float = 0.5
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-load-test"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        # Uniform jitter around the mean latency, like a real API under load
+        time.sleep(self.latency * random.uniform(1 - self.jitter, 1 + self.jitter))
+        prompt_chars = sum(len(str(message.content)) for message in messages)
+        message = AIMessage(
+            content=self.response,
+            usage_metadata={
+                'input_tokens': prompt_chars // 4,
+                'output_tokens': len(self.response) // 4,
+                'total_tokens': (prompt_chars + len(self.response)) // 4
+            }
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+def make_document(file_type: str, size_kb: int, seed: int) -> bytes:
+    """Build a synthetic TXT or CSV document of roughly size_kb kilobytes"""
+    rng = random.Random(seed)
+    words = ["revenue", "customer", "order", "region", "quarter", "product", "growth", "margin"]
+    target = size_kb * 1024
+    lines = []
+    size = 0
+    if file_type == 'csv':
+        lines.append("id,region,product,amount")
+        while size < target:
+            line = f"{len(lines)},{rng.choice(words)},{rng.choice(words)},{rng.randint(1, 10000)}"
+            lines.append(line)
+            size += len(line) + 1
+    else:
+        while size < target:
+            line = " ".join(rng.choice(words) for _ in range(12)) + "."
+            lines.append(line if len(lines) % 8 else "\n" + line)
+            size += len(line) + 1
+    return "\n".join(lines).encode('utf-8')
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class LoadTest:
+    """Drive simulated user sessions through the upload, chat and SQL flows"""
+
+    def __init__(self, args):
+        self.args = args
+        self._lock = threading.Lock()
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+        # The app modules read configuration at import time, so they are set up here
+        os.environ.setdefault("GROQ_API_KEY", "load-test")
+        for name, value in (("DB_USER", "load"), ("DB_PASSWORD", "load"), ("DB_HOST", "localhost"),
+                            ("DB_PORT", "5432"), ("DB_NAME", "load")):
+            os.environ.setdefault(name, value)
+
+        import db
+        import file_processor
+        import llm_chain
+
+        self.db = db
+        self.file_processor = file_processor
+
+        self.chat_llm = FakeLLM(latency=args.llm_latency)
+        sql_llm = FakeLLM(latency=args.llm_latency, response=args.sql)
+        llm_chain.sql_chain = llm_chain.sql_prompt | sql_llm | llm_chain.parser
+        self.natural_to_sql = llm_chain.natural_to_sql
+
+        if not args.skip_sql:
+            engine = create_engine(args.db_url, pool_size=args.pool_size, max_overflow=args.pool_size)
+            db.engine = engine
+            db.router.engines["primary"] = engine
+            self._seed_database(engine)
+
+        self.documents = [
+            (f"doc_{i}.{file_type}", make_document(file_type, args.doc_kb, i), file_type)
+            for i, file_type in enumerate(['txt', 'csv'] * ((args.docs + 1) // 2))
+        ][:args.docs]
+
+    def _seed_database(self, engine):
+        """Create the table the simulated SQL question queries"""
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS load_test_items"))
+            conn.execute(text("CREATE TABLE load_test_items (id INTEGER PRIMARY KEY, name TEXT, amount INTEGER)"))
+            conn.execute(
+                text("INSERT INTO load_test_items (id, name, amount) VALUES (:id, :name, :amount)"),
+                [{'id': i, 'name': f"item {i}", 'amount': i % 1000} for i in range(self.args.rows)]
+            )
+
+    def _timed(self, operation: str, func, *args):
+        """Run one operation, recording its latency or failure"""
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+            ok = not (isinstance(result, str) and result.startswith(ERROR_PREFIXES))
+        except Exception:
+            result, ok = None, False
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if ok:
+                self.latencies.setdefault(operation, []).append(elapsed)
+            else:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+        return result
+
+    def run_session(self, session_id: int):
+        """One simulated user: upload all documents, chat, then ask a SQL question"""
+        processor = self.file_processor.FileProcessor()
+        processor.llm = self.chat_llm
+
+        for name, content, file_type in self.documents:
+            # Streamlit hands over the upload buffer as a memoryview
+            self._timed('upload', processor.process_uploaded_file, name, memoryview(content), file_type)
+
+        for turn in range(self.args.chat_turns):
+            self._timed('chat', processor.chat_with_files, f"Session {session_id} question {turn}: what is the total revenue?")
+
+        if not self.args.skip_sql:
+            sql_query = self._timed('sql_generate', self.natural_to_sql, "How many items are there?")
+            self._timed('sql_execute', lambda q: self.db.execute_sql_async(q).result()[1], sql_query)
+
+        # Returned so the session's memory stays alive until it is measured
+        return processor
+
+    def run_level(self, concurrency: int) -> Dict[str, Any]:
+        """Run `concurrency` sessions at once and summarize them"""
+        self.latencies = {}
+        self.errors = {}
+
+        # Arrow allocates outside the Python heap, so its pool is sampled alongside tracemalloc
+        arrow_start = pa.total_allocated_bytes()
+        arrow_peak = [arrow_start]
+        stop_sampling = threading.Event()
+
+        def sample_arrow():
+            while not stop_sampling.wait(ARROW_SAMPLE_INTERVAL):
+                arrow_peak[0] = max(arrow_peak[0], pa.total_allocated_bytes())
+
+        sampler = threading.Thread(target=sample_arrow, daemon=True)
+        sampler.start()
+        tracemalloc.start()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            sessions = list(pool.map(self.run_session, range(concurrency)))
+        elapsed = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stop_sampling.set()
+        sampler.join()
+        arrow_current = max(pa.total_allocated_bytes() - arrow_start, 0)
+        del sessions
+
+        operations = sum(len(values) for values in self.latencies.values())
+        return {
+            'concurrency': concurrency,
+            'seconds': elapsed,
+            'operations': operations,
+            'throughput': operations / elapsed if elapsed else 0.0,
+            'sessions_per_second': concurrency / elapsed if elapsed else 0.0,
+            'memory_per_session_mb': (current + arrow_current) / concurrency / 1e6,
+            'peak_memory_mb': peak / 1e6,
+            'arrow_peak_mb': (arrow_peak[0] - arrow_start) / 1e6,
+            'latencies': dict(self.latencies),
+            'errors': dict(self.errors)
+        }
+
+
+def print_report(results: List[Dict[str, Any]]):
+    """Print throughput, memory and latency percentiles per concurrency level"""
+    summary = [
+        [r['concurrency'], f"{r['seconds']:.2f}", r['operations'], f"{r['throughput']:.1f}",
+         f"{r['sessions_per_second']:.2f}", f"{r['memory_per_session_mb']:.2f}", f"{r['peak_memory_mb']:.1f}",
+         f"{r['arrow_peak_mb']:.1f}", sum(r['errors'].values())]
+        for r in results
+    ]
+    print("\n📈 Throughput and memory")
+    print(tabulate(summary, headers=["Sessions", "Seconds", "Ops", "Ops/s", "Sessions/s",
+                                     "MB/session", "Peak MB", "Arrow peak MB", "Errors"], tablefmt="grid"))
+    print("MB/session covers Python objects and Arrow buffers; Peak MB is the Python heap only. "
+          "Other native memory (driver buffers, mapped files) is not measured.")
+
+    rows = []
+    for r in results:
+        # Operations that only failed have no latencies but still get a row
+        for operation in list(r['latencies']) + [op for op in r['errors'] if op not in r['latencies']]:
+            values = r['latencies'].get(operation, [])
+            rows.append([r['concurrency'], operation, len(values),
+                         f"{percentile(values, 50) * 1000:.0f}", f"{percentile(values, 95) * 1000:.0f}",
+                         f"{percentile(values, 99) * 1000:.0f}", r['errors'].get(operation, 0)])
+    print("\n⏱️ Latency (ms)")
+    print(tabulate(rows, headers=["Sessions", "Operation", "Count", "p50", "p95", "p99", "Errors"], tablefmt="grid"))
+
+
+def parse_args(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Load test the assistant with simulated concurrent sessions")
+    parser.add_argument("--concurrency", default="1,5,10,25",
+                        help="Comma-separated numbers of simultaneous sessions to ramp through")
+    parser.add_argument("--docs", type=int, default=2, help="Documents uploaded per session")
+    parser.add_argument("--doc-kb", type=int, default=100, help="Approximate size of each document in KB")
+    parser.add_argument("--chat-turns", type=int, default=3, help="Chat questions asked per session")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mean fake LLM latency in seconds")
+    parser.add_argument("--db-url", default=f"sqlite:///{os.path.join(tempfile.gettempdir(), 'load_test.db')}",
+                        help="SQLAlchemy URL of the local database for the SQL flow "
+                             "(its load_test_items table is recreated)")
+    parser.add_argument("--rows", type=int, default=10000, help="Rows seeded into the load test table")
+    parser.add_argument("--sql", default="SELECT name, amount FROM load_test_items WHERE amount > 500",
+                        help="SQL the fake LLM returns for every question")
+    parser.add_argument("--pool-size", type=int, default=10, help="Database connection pool size")
+    parser.add_argument("--skip-sql", action="store_true", help="Only run the upload and chat flows")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    levels = [int(level) for level in args.concurrency.split(",") if level.strip()]
+
+    print("🧪 Load test")
+    print(f"Levels: {levels} | docs/session: {args.docs} x {args.doc_kb} KB | "
+          f"chat turns: {args.chat_turns} | LLM latency: {args.llm_latency}s")
+
+    load_test = LoadTest(args)
+    # Warm-up session so lazy imports and caches are not billed to the first level
+    load_test.run_session(-1)
+
+    results = []
+    for concurrency in levels:
+        print(f"\n▶️ Running {concurrency} concurrent sessions...")
+        results.append(load_test.run_level(concurrency))
+
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
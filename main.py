@@ -1,13 +1,109 @@
-from llm_chain import natural_to_sql
-from db import execute_sql
+from llm_chain import natural_to_sql, natural_to_sql_candidates
+from db import execute_sql_async, export_sql_async, rank_sql_candidates, EXPORT_FORMATS, router
 from chat_with_files import FileChatInterface
 from tabulate import tabulate
 
+# Rows printed per page of query results
+PAGE_SIZE = 50
+
+# Seconds to wait for the database to acknowledge a cancel before giving up on the job
+CANCEL_WAIT_SECONDS = 10
+
+def wait_for_job(job):
+    """Wait for a query job, cancelling it on Ctrl-C"""
+    try:
+        return job.result()
+    except KeyboardInterrupt:
+        print("\n🛑 Cancelling query... (press Ctrl-C again to stop waiting)")
+        job.cancel()
+    
+    try:
+        return job.result(timeout=CANCEL_WAIT_SECONDS)
+    except (KeyboardInterrupt, TimeoutError):
+        # The job thread is a daemon, so it cannot keep the CLI from moving on
+        return None, "🛑 Query cancelled; stopped waiting for the database to confirm."
+
+def show_paginated_table(columns, table, page_size: int = PAGE_SIZE):
+    """Print an Arrow result table page by page"""
+    total_rows = table.num_rows
+    if total_rows == 0:
+        print(tabulate([], headers=columns, tablefmt="grid"))
+        print("(0 rows)")
+        return
+    
+    for start in range(0, total_rows, page_size):
+        # Only the current page is converted back to Python rows
+        page = table.slice(start, page_size)
+        rows = list(zip(*(column.to_pylist() for column in page.columns)))
+        print(tabulate(rows, headers=columns, tablefmt="grid"))
+        
+        end = start + page.num_rows
+        print(f"Rows {start + 1}-{end} of {total_rows}")
+        if end < total_rows:
+            answer = input("Press Enter for next page or 'q' to stop: ").strip().lower()
+            if answer == 'q':
+                break
+
+def ask_export_format():
+    """Ask whether to export the results instead of showing them; returns the format or None"""
+    while True:
+        file_format = input("Export results to a file instead of showing them? "
+                            "Enter 'csv' or 'parquet' (or press Enter to show them): ").strip().lower()
+        if not file_format:
+            return None
+        if file_format in EXPORT_FORMATS:
+            return file_format
+        print("❌ Invalid format. Please choose csv or parquet.")
+
+def export_results(sql_query: str, file_format: str, fan_out: bool = False):
+    """Stream the query results straight to a CSV or Parquet file (from every shard with fan_out)"""
+    path = input(f"Output file path [results.{file_format}]: ").strip() or f"results.{file_format}"
+    
+    def show_progress(stats):
+        print(f"\r  {stats['rows']:,} rows written ({stats['rows_per_second']:,.0f} rows/s)", end="", flush=True)
+    
+    print(f"\nExporting to {path}... (press Ctrl-C to cancel)")
+    job = export_sql_async(sql_query, path, file_format, progress_callback=show_progress, fan_out=fan_out)
+    stats, message = wait_for_job(job)
+    print()
+    print(message)
+
+def choose_cheapest_sql(question: str):
+    """Generate candidate queries and return the one with the cheapest plan"""
+    print("\nGenerating candidate queries...\n")
+    candidates, errors = natural_to_sql_candidates(question)
+    for error in errors:
+        print(f"  ⚠️ {error}")
+    if not candidates:
+        print("\n❌ No candidate queries could be generated.")
+        return None
+    
+    ranked = rank_sql_candidates(candidates)
+    
+    for i, candidate in enumerate(ranked, 1):
+        if candidate['error']:
+            print(f"  {i}. ❌ Rejected: {candidate['error']}")
+        else:
+            print(f"  {i}. Estimated cost {candidate['cost']:,.2f}")
+        print(f"     {' '.join(candidate['sql'].split())}")
+    
+    valid = [candidate for candidate in ranked if candidate['error'] is None]
+    if not valid:
+        print("\n❌ None of the candidate queries could be planned by the database.")
+        return None
+    
+    print(f"\n🔹 Chosen SQL:\n{valid[0]['sql']}\n")
+    print(f"🔹 Query plan:\n{valid[0]['plan']}\n")
+    return valid[0]['sql']
+
 def text_to_sql_mode():
     """Handle Text-to-SQL functionality"""
     print("\n🔍 Text-to-SQL Mode")
     print("Type 'back' to return to main menu or 'exit' to quit\n")
     
+    answer = input("Generate several candidate queries and run the cheapest plan? (y/N): ").strip().lower()
+    compare_plans = answer == 'y'
+    
     while True:
         question = input("Enter your question in natural language: ").strip()
         
@@ -19,14 +115,32 @@ def text_to_sql_mode():
         if not question:
             continue
             
-        print("\nConverting to SQL...\n")
-        sql_query = natural_to_sql(question)
-        print(f"🔹 Generated SQL:\n{sql_query}\n")
+        if compare_plans:
+            sql_query = choose_cheapest_sql(question)
+            if not sql_query:
+                continue
+        else:
+            print("\nConverting to SQL...\n")
+            sql_query = natural_to_sql(question)
+            print(f"🔹 Generated SQL:\n{sql_query}\n")
+        
+        fan_out = False
+        if router.shards:
+            answer = input(f"Run across all {len(router.shards)} shards? (y/N): ").strip().lower()
+            fan_out = answer == 'y'
+        
+        # Asked before running, so an export is the query's only run and rows never pile up in memory
+        file_format = ask_export_format()
+        if file_format:
+            export_results(sql_query, file_format, fan_out)
+            print("\n" + "-" * 80 + "\n")
+            continue
         
-        print("Executing query...\n")
-        columns, result = execute_sql(sql_query)
+        print("Executing query... (press Ctrl-C to cancel)\n")
+        job = execute_sql_async(sql_query, fan_out=fan_out)
+        columns, result = wait_for_job(job)
         if columns:
-            print(tabulate(result, headers=columns, tablefmt="grid"))
+            show_paginated_table(columns, result)
         else:
             print(result)
         print("\n" + "-" * 80 + "\n")
@@ -40,7 +154,7 @@ def main():
     while True:
         print("\n🎯 Main Menu")
         print("1. 🔍 Text-to-SQL (Database Query)")
-        print("2. 📁 Chat with Files (PDF, TXT, CSV, DOCX)")
+        print("2. 📁 Chat with Files (PDF, TXT, CSV, DOCX, XLSX, PPTX, ...)")
         print("3. 🚪 Exit")
         
         choice = input("\nSelect mode (1-3): ").strip()
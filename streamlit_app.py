@@ -1,9 +1,18 @@
 import streamlit as st
 import os
-import tempfile
-from llm_chain import natural_to_sql
-from db import execute_sql
+import secrets
+import time
+from llm_chain import natural_to_sql, natural_to_sql_candidates, DEFAULT_CANDIDATES
+from db import execute_sql_async, export_sql_async, rank_sql_candidates, EXPORT_FORMATS, DB_QUERY_TIMEOUT, DB_EXPORT_TIMEOUT, router
 from file_processor import FileProcessor
+from extractors import supported_file_types
+
+# Exports are written here and streamed from disk by Streamlit's static file
+# serving (enableStaticServing in .streamlit/config.toml), never loaded into memory
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "exports")
+
+# Exported files older than this (seconds) are deleted
+EXPORT_RETENTION_SECONDS = 3600
 
 # Page configuration
 st.set_page_config(
@@ -58,6 +67,12 @@ if 'chat_history' not in st.session_state:
     st.session_state.chat_history = []
 if 'current_mode' not in st.session_state:
     st.session_state.current_mode = None
+if 'sql_job' not in st.session_state:
+    st.session_state.sql_job = None
+if 'export_file' not in st.session_state:
+    st.session_state.export_file = None
+if 'export_job' not in st.session_state:
+    st.session_state.export_job = None
 
 def show_text_to_sql():
     """Show Text-to-SQL interface"""
@@ -70,25 +85,55 @@ def show_text_to_sql():
         height=100
     )
     
+    fan_out = False
+    if router.shards:
+        fan_out = st.checkbox(f"Run across all {len(router.shards)} shards and merge the results")
+    
+    # Chosen before the query runs, so an export is the query's only run and rows never pile up in memory
+    output = st.radio("Results", ["Show in a table", "Export to a file"], horizontal=True)
+    export_format = None
+    if output == "Export to a file":
+        export_format = st.selectbox("Format", EXPORT_FORMATS, format_func=str.upper)
+        # Separate from the query timeout: large exports may legitimately run for a long time
+        timeout = st.number_input(
+            "Export time limit (seconds, 0 = none)",
+            min_value=0.0,
+            value=DB_EXPORT_TIMEOUT,
+            step=60.0,
+            help=f"Each statement the export sends is still limited to {DB_QUERY_TIMEOUT:g}s (DB_QUERY_TIMEOUT)."
+        )
+    else:
+        timeout = st.number_input(
+            "Query timeout (seconds, 0 = none)",
+            min_value=0.0,
+            value=DB_QUERY_TIMEOUT,
+            step=5.0
+        )
+    
+    compare_plans = st.checkbox("Generate several candidate queries and run the one with the cheapest plan")
+    num_candidates = DEFAULT_CANDIDATES
+    if compare_plans:
+        num_candidates = st.slider("Number of candidates", min_value=2, max_value=6, value=DEFAULT_CANDIDATES)
+    
     col1, col2 = st.columns(2)
     
     with col1:
         if st.button("🚀 Convert to SQL", use_container_width=True):
             if question:
-                with st.spinner("Converting to SQL..."):
-                    sql_query = natural_to_sql(question)
-                
-                st.markdown("**Generated SQL:**")
-                st.code(sql_query, language="sql")
-                
-                with st.spinner("Executing query..."):
-                    columns, result = execute_sql(sql_query)
-                
-                if columns:
-                    st.markdown("**Results:**")
-                    st.dataframe(result)
+                if compare_plans:
+                    sql_query = choose_cheapest_sql(question, num_candidates)
                 else:
-                    st.info(result)
+                    with st.spinner("Converting to SQL..."):
+                        sql_query = natural_to_sql(question)
+                    
+                    st.markdown("**Generated SQL:**")
+                    st.code(sql_query, language="sql")
+                
+                if sql_query and export_format:
+                    start_export(sql_query, export_format, timeout, fan_out)
+                elif sql_query:
+                    # Runs in the background so the query can be cancelled from the UI
+                    st.session_state.sql_job = execute_sql_async(sql_query, timeout=timeout, fan_out=fan_out)
             else:
                 st.warning("Please enter a question first")
     
@@ -96,6 +141,155 @@ def show_text_to_sql():
         if st.button("⬅️ Back to Main Menu", use_container_width=True):
             st.session_state.current_mode = None
             st.rerun()
+    
+    if st.session_state.sql_job:
+        show_query_job(st.session_state.sql_job)
+    
+    if st.session_state.export_job:
+        show_export_job(st.session_state.export_job)
+    show_export_download()
+
+def choose_cheapest_sql(question: str, num_candidates: int):
+    """Generate candidate queries, show their plans and return the cheapest valid one"""
+    with st.spinner(f"Generating {num_candidates} candidate queries..."):
+        candidates, errors = natural_to_sql_candidates(question, num_candidates)
+    
+    for error in errors:
+        st.warning(error)
+    if not candidates:
+        st.error("No candidate queries could be generated.")
+        return None
+    
+    with st.spinner("Comparing query plans..."):
+        ranked = rank_sql_candidates(candidates)
+    
+    valid = [candidate for candidate in ranked if candidate['error'] is None]
+    if valid:
+        best = valid[0]
+        st.markdown(f"**Chosen SQL** (estimated cost {best['cost']:,.2f}):")
+        st.code(best['sql'], language="sql")
+        with st.expander("Query plan"):
+            st.code(best['plan'])
+    else:
+        st.error("None of the candidate queries could be planned by the database.")
+    
+    alternatives = ranked[1:] if valid else ranked
+    if alternatives:
+        with st.expander(f"Alternatives ({len(alternatives)})"):
+            for candidate in alternatives:
+                if candidate['error']:
+                    st.markdown(f"❌ Rejected: {candidate['error']}")
+                else:
+                    st.markdown(f"Estimated cost {candidate['cost']:,.2f}")
+                st.code(candidate['sql'], language="sql")
+    
+    return valid[0]['sql'] if valid else None
+
+def show_query_job(job):
+    """Wait for a running query, offering a cancel button, then show its results"""
+    if not job.done():
+        # Clicking reruns the script, which lands here again and cancels the job
+        if st.button("🛑 Cancel Query", use_container_width=True, key="cancel_query"):
+            job.cancel()
+    
+    status = st.empty()
+    while not job.done():
+        status.info(f"⏳ Executing query... {job.elapsed:.1f}s")
+        time.sleep(0.25)
+    status.empty()
+    
+    st.session_state.sql_job = None
+    columns, result = job.result()
+    if columns:
+        st.markdown(f"**Results:** {result.num_rows} rows × {result.num_columns} columns ({job.elapsed:.2f}s)")
+        # Arrow table is rendered as-is, keeping column names and types
+        st.dataframe(result, use_container_width=True)
+    else:
+        st.info(result)
+
+def remove_export(file_name: str):
+    """Delete an exported file if it still exists"""
+    path = os.path.join(EXPORT_DIR, file_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+def cleanup_exports():
+    """Delete exported files that are past their retention period"""
+    if not os.path.isdir(EXPORT_DIR):
+        return
+    cutoff = time.time() - EXPORT_RETENTION_SECONDS
+    for entry in os.scandir(EXPORT_DIR):
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            # Another session may have removed it first
+            pass
+
+def start_export(sql_query: str, file_format: str, timeout: float, fan_out: bool = False):
+    """Start streaming a query's results to a file in the export folder (from every shard with fan_out)"""
+    cleanup_exports()
+    # A new export replaces this session's previous one; a cancelled export removes its own file
+    if st.session_state.export_job:
+        st.session_state.export_job['job'].cancel()
+        st.session_state.export_job = None
+    if st.session_state.export_file:
+        remove_export(st.session_state.export_file['name'])
+        st.session_state.export_file = None
+    
+    # Unguessable name, since anything in the static folder is downloadable by URL
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    file_name = f"{secrets.token_urlsafe(16)}.{file_format}"
+    progress = {}
+    # Results are streamed to disk batch by batch in the background, never held in memory
+    job = export_sql_async(sql_query, os.path.join(EXPORT_DIR, file_name), file_format,
+                           timeout=timeout, progress_callback=progress.update, fan_out=fan_out)
+    st.session_state.export_job = {'job': job, 'name': file_name, 'format': file_format, 'progress': progress}
+
+def show_export_download():
+    """Show a download link for this session's finished export"""
+    export_file = st.session_state.export_file
+    if export_file and os.path.exists(os.path.join(EXPORT_DIR, export_file['name'])):
+        # The browser downloads straight from the static route, which streams the file from disk
+        st.markdown(
+            f'<a href="app/static/exports/{export_file["name"]}" '
+            f'download="query_results.{export_file["format"]}">'
+            f'⬇️ Download {export_file["format"].upper()}</a>',
+            unsafe_allow_html=True
+        )
+
+def show_export_job(export_job: dict):
+    """Wait for a running export, offering a cancel button, then record the finished file"""
+    job = export_job['job']
+    if not job.done():
+        # Clicking reruns the script, which lands here again and cancels the export
+        if st.button("🛑 Cancel Export", use_container_width=True, key="cancel_export"):
+            job.cancel()
+    
+    status = st.empty()
+    while not job.done():
+        # The export thread only updates the dict; widgets are drawn from the script thread
+        rows = export_job['progress'].get('rows', 0)
+        status.info(f"⏳ Exporting results... {rows:,} rows written ({job.elapsed:.1f}s)")
+        time.sleep(0.25)
+    
+    st.session_state.export_job = None
+    stats, message = job.result()
+    if stats:
+        status.success(message)
+        st.session_state.export_file = {'name': export_job['name'], 'format': export_job['format']}
+    else:
+        # export_sql removes partial files itself; this also covers a job that never opened one
+        remove_export(export_job['name'])
+        status.error(message)
+
+def format_usage(usage: dict) -> str:
+    """Format per-turn token counts for display"""
+    text = (f"Tokens: ~{usage['context_tokens']:,} context, ~{usage['history_tokens']:,} history, "
+            f"~{usage['question_tokens']:,} question")
+    if usage.get('input_tokens') is not None:
+        text += f" · {usage['input_tokens']:,} in / {usage['output_tokens']:,} out (reported)"
+    return text
 
 def show_file_chat():
     """Show File Chat interface"""
@@ -105,8 +299,8 @@ def show_file_chat():
     # File upload section
     st.markdown("### 📤 Upload Files")
     uploaded_file = st.file_uploader(
-        "Choose a file (PDF, TXT, CSV, DOCX)",
-        type=['pdf', 'txt', 'csv', 'docx'],
+        "Choose a file (PDF, TXT, CSV, DOCX, XLSX, PPTX, HTML, JSON)",
+        type=supported_file_types(),
         key="file_uploader"
     )
     
@@ -119,7 +313,8 @@ def show_file_chat():
                 file_type = uploaded_file.name.split('.')[-1].lower()
                 result = st.session_state.file_processor.process_uploaded_file(
                     uploaded_file.name, 
-                    uploaded_file.getvalue(), 
+                    # getbuffer() is a view of the upload, so nothing is copied
+                    uploaded_file.getbuffer(), 
                     file_type
                 )
             
@@ -156,6 +351,8 @@ def show_file_chat():
                 st.markdown(f"**You:** {chat['content']}")
             else:
                 st.markdown(f"**Assistant:** {chat['content']}")
+                if chat.get('usage'):
+                    st.caption(format_usage(chat['usage']))
         
         # Chat input
         chat_input = st.text_input(
@@ -181,7 +378,8 @@ def show_file_chat():
                 # Add AI response to history
                 st.session_state.chat_history.append({
                     'type': 'assistant',
-                    'content': response
+                    'content': response,
+                    'usage': dict(st.session_state.file_processor.get_last_turn_usage())
                 })
                 
                 st.rerun()
@@ -189,6 +387,7 @@ def show_file_chat():
         with col2:
             if st.button("🗑️ Clear Chat", use_container_width=True):
                 st.session_state.chat_history = []
+                st.session_state.file_processor.clear_memory()
                 st.rerun()
         
         with col3:
@@ -228,7 +427,7 @@ def main():
         
         **🔍 Text-to-SQL**: Convert your natural language questions into SQL queries and execute them on your database.
         
-        **📁 Chat with Files**: Upload documents (PDF, TXT, CSV, DOCX) and ask questions about their content.
+        **📁 Chat with Files**: Upload documents (PDF, TXT, CSV, DOCX, XLSX, PPTX, HTML, JSON) and ask questions about their content.
         """)
     
     # Show the selected mode